@@ -2,10 +2,16 @@ import datetime
 from dateutil import relativedelta
 import requests
 import os
+import re
+import time
 
 HEADERS = {'authorization': 'token ' + os.environ['ACCESS_TOKEN']}
 USER_NAME = os.environ['USER_NAME']
 CACHE_FILE = 'cache/repo_list.txt'
+DEBUG_FILE = 'debug.txt'
+# The workflow sets one RUN_DEADLINE for all of its scripts, each script run on its own gets RUN_BUDGET seconds
+DEADLINE = float(os.environ.setdefault('RUN_DEADLINE', str(time.time() + float(os.environ.get('RUN_BUDGET', 1800)))))
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 60))
 
 
 def daily_readme(birthday):
@@ -14,8 +20,12 @@ def daily_readme(birthday):
         diff.years, diff.months, diff.days,
         ' 🎂' if (diff.months == 0 and diff.days == 0) else '')
 
+def request_timeout():
+    # Requests never run past the run deadline, but always get at least a second
+    return min(REQUEST_TIMEOUT, max(DEADLINE - time.time(), 1))
+
 def simple_request(query, variables):
-    response = requests.post('https://api.github.com/graphql', json={'query': query, 'variables': variables}, headers=HEADERS)
+    response = requests.post('https://api.github.com/graphql', json={'query': query, 'variables': variables}, headers=HEADERS, timeout=request_timeout())
     if response.status_code == 200:
         return response
     else:
@@ -52,6 +62,44 @@ def user_getter(username):
         'stars': data.get('starredRepositories', {}).get('totalCount', 0),
     }
 
+def read_previous_debug(filename):
+    # The values the last run wrote to debug.txt, to fall back on when a request fails
+    patterns = {
+        'createdAt': r'^- Account Created: (.+)$',
+        'repositories': r'^- Repos: (\d+)',
+        'merged_prs': r'^- PRs: \d+ \(merged: (\d+)',
+        'open_prs': r'^- PRs: .*open: (\d+)\)',
+        'closed_issues': r'^- Issues: \d+ \(closed: (\d+)',
+        'open_issues': r'^- Issues: .*open: (\d+)\)',
+        'stars': r'^- Stars: (\d+)',
+        'followers': r'^- Followers: (\d+)',
+    }
+    if not os.path.exists(filename):
+        return {}
+
+    with open(filename, 'r') as f:
+        text = f.read()
+
+    previous = {}
+    for key, pattern in patterns.items():
+        match = re.search(pattern, text, re.MULTILINE)
+        if match:
+            previous[key] = match.group(1) if key == 'createdAt' else int(match.group(1))
+    return previous
+
+def user_fallback(previous):
+    # Same shape as user_getter(), from the last run's debug.txt
+    created_at = previous.get('createdAt')
+    if created_at is not None:
+        created_at = datetime.datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%dT%H:%M:%SZ')
+    return {
+        'id': 'No ID found',
+        'createdAt': created_at or 'No creation date found',
+        'followers': previous.get('followers', 0),
+        'repositories': previous.get('repositories', 0),
+        'stars': previous.get('stars', 0),
+    }
+
 def read_cache(filename):
     if not os.path.exists(filename):
         return {}
@@ -156,7 +204,15 @@ def svg_overwrite(filename, age_data, commit_data, star_data, repo_data, contrib
         print(f"Error processing {filename}: {e}")
 
 if __name__ == '__main__':
-    user_data = user_getter(USER_NAME)
+    # If a request times out or can't connect, fall back to what the last run wrote to debug.txt
+    previous = read_previous_debug(DEBUG_FILE)
+    report = {}
+    try:
+        user_data = user_getter(USER_NAME)
+        report['account data'] = 'fresh'
+    except (requests.Timeout, requests.ConnectionError) as e:
+        user_data = user_fallback(previous)
+        report['account data'] = f'stale ({e})'
     
     if user_data['createdAt'] == 'No creation date found':
         print("Error: Could not retrieve account creation date.")
@@ -169,13 +225,18 @@ if __name__ == '__main__':
         num_repos, num_contributed_to, total_commits, total_lines_added, total_lines_deleted = calculate_stats_from_cache(cache_data)
 
         # Fetch PR and issue statistics
-        merged_prs, open_prs, closed_issues, open_issues = fetch_prs_and_issues(USER_NAME)
+        try:
+            merged_prs, open_prs, closed_issues, open_issues = fetch_prs_and_issues(USER_NAME)
+            report['PRs and issues'] = 'fresh'
+        except (requests.Timeout, requests.ConnectionError) as e:
+            merged_prs, open_prs, closed_issues, open_issues = (previous.get(key, 0) for key in ('merged_prs', 'open_prs', 'closed_issues', 'open_issues'))
+            report['PRs and issues'] = f'stale ({e})'
 
         # Get stars and followers for debug output
         stars = user_data['stars']
         followers = user_data['followers']
 
-        with open('debug.txt', 'w') as f:
+        with open(DEBUG_FILE, 'w') as f:
             f.write(f"- Account Created: {acc_date}\n")
             f.write(f"- Age: {age_data}\n")
             f.write(f"- Repos: {user_data['repositories']} {{Contributed: {num_contributed_to}}}\n")
@@ -190,3 +251,7 @@ if __name__ == '__main__':
         # Call the SVG overwrite function with correct parameters
         svg_overwrite('dark_mode.svg', age_data, total_commits, stars, user_data['repositories'], num_contributed_to, followers, total_lines_added - total_lines_deleted, total_lines_added, total_lines_deleted)
         svg_overwrite('white_mode.svg', age_data, total_commits, stars, user_data['repositories'], num_contributed_to, followers, total_lines_added - total_lines_deleted, total_lines_added, total_lines_deleted)
+
+    print('Run report:')
+    for source, state in report.items():
+        print(f"   {source}: {state}")
@@ -5,6 +5,13 @@ import time
 
 ACCESS_TOKEN = os.environ['ACCESS_TOKEN']
 GITHUB_API_URL = 'https://api.github.com'
+# The workflow sets one RUN_DEADLINE for all of its scripts, each script run on its own gets RUN_BUDGET seconds
+DEADLINE = float(os.environ.setdefault('RUN_DEADLINE', str(time.time() + float(os.environ.get('RUN_BUDGET', 1800)))))
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 60))
+
+def request_timeout():
+    # Requests never run past the run deadline, but always get at least a second
+    return min(REQUEST_TIMEOUT, max(DEADLINE - time.time(), 1))
 
 def get_repositories(username):
     url = f"{GITHUB_API_URL}/users/{username}/repos"
@@ -12,7 +19,7 @@ def get_repositories(username):
     repos = []
     
     while url:
-        response = requests.get(url, headers=headers)
+        response = requests.get(url, headers=headers, timeout=request_timeout())
         
         if response.status_code != 200:
             print(f"Failed to fetch repositories: {response.json()}")
@@ -38,7 +45,7 @@ def get_commit_stats(username, repo_name):
     start_time = time.time()
     url = f"{GITHUB_API_URL}/repos/{username}/{repo_name}/commits"
     headers = {'Authorization': f'token {ACCESS_TOKEN}'}
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=headers, timeout=request_timeout())
     
     if response.status_code == 404:
         print(f"Repository {repo_name} not found.")
@@ -60,7 +67,7 @@ def get_commit_stats(username, repo_name):
     
     for commit in commits:
         commit_url = commit['url']
-        commit_response = requests.get(commit_url, headers=headers)
+        commit_response = requests.get(commit_url, headers=headers, timeout=request_timeout())
         if commit_response.status_code == 200:
             commit_data = commit_response.json()
             if 'files' in commit_data:
@@ -119,8 +126,16 @@ def write_cache_file(username, repos, existing_data):
                 loc_added = existing_data[repo_name]['loc_added']
                 loc_deleted = existing_data[repo_name]['loc_deleted']
                 print(f"Skipping {repo_name}, already cached.")
+            elif time.time() >= DEADLINE:
+                # Leave it out of the cache, so the next run fetches it
+                print(f"Skipping {repo_name}, the run deadline has been reached.")
+                continue
             else:
-                total_commits, loc_added, loc_deleted = get_commit_stats(username, repo_name)
+                try:
+                    total_commits, loc_added, loc_deleted = get_commit_stats(username, repo_name)
+                except (requests.Timeout, requests.ConnectionError):
+                    print(f"Skipping {repo_name}, its requests timed out or couldn't connect.")
+                    continue
 
             repo_hash = hash_repo_name(repo_name)
             line = (f"{repo_name} {repo_hash} {total_commits} {total_commits} "
@@ -129,7 +144,12 @@ def write_cache_file(username, repos, existing_data):
 
 def main():
     username = "debghs"  # Replace with your actual username
-    repos = get_repositories(username)
+    try:
+        repos = get_repositories(username)
+    except (requests.Timeout, requests.ConnectionError) as e:
+        # Leave cache/repo_list.txt as it is, so the next steps still render from the last cache
+        print(f"Run report: repository list stale ({e}), keeping the existing cache.")
+        return
     existing_data, existing_repos = read_cache_file(username)
 
     # Update the cache
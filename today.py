@@ -5,6 +5,26 @@ import os
 from xml.dom import minidom
 import time
 import hashlib
+import argparse
+import base64
+import subprocess
+import json
+import hmac
+import threading
+import cProfile
+import pstats
+import tracemalloc
+import shutil
+import concurrent.futures
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+try:
+    import orjson # optional, parses large responses several times faster
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # Fine-grained personal access token with All Repositories access:
 # Account permissions: read:Followers, read:Starring, read:Watching
@@ -12,7 +32,54 @@ import hashlib
 # Issues and pull requests permissions not needed at the moment, but may be used in the future
 HEADERS = {'authorization': 'token '+ os.environ['ACCESS_TOKEN']}
 USER_NAME = os.environ['USER_NAME'] # 'debghs'
-QUERY_COUNT = {'user_getter': 0, 'follower_getter': 0, 'graph_repos_stars': 0, 'recursive_loc': 0, 'graph_commits': 0, 'loc_query': 0}
+QUERY_COUNT = {'user_getter': 0, 'follower_getter': 0, 'graph_repos_stars': 0, 'recursive_loc': 0, 'graph_commits': 0, 'loc_query': 0, 'push_commit_stats': 0}
+BIRTHDAY = datetime.datetime(2002, 7, 5)
+
+# Run deadline, shared with the git engine's worker processes through the environment
+# Every request and git command times out before it, leaving DEADLINE_MARGIN seconds to save the cache and render the SVGs
+RUN_BUDGET = float(os.environ.get('RUN_BUDGET', 1800)) # seconds
+DEADLINE = float(os.environ.setdefault('RUN_DEADLINE', str(time.time() + RUN_BUDGET)))
+DEADLINE_MARGIN = float(os.environ.get('DEADLINE_MARGIN', 30))
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 60)) # longest a single request may take
+RUN_REPORT = {} # stage -> 'fresh', or 'stale' and why
+
+# Settings for the local git LOC engine (--loc-engine git)
+# GIT_REMOTE can point at a directory of local repositories, e.g. '/tmp/repos/{}', to run the engine offline
+LOC_ENGINE = 'graphql'
+GIT_REMOTE = os.environ.get('GIT_REMOTE', 'https://github.com/{}.git')
+GIT_AUTHORS = os.environ.get('GIT_AUTHORS', USER_NAME + '@users.noreply.github.com').split(',') # emails or names my commits are authored with
+GIT_WORKERS = int(os.environ.get('GIT_WORKERS', os.cpu_count() or 1))
+MIRROR_DIR = 'cache/mirrors'
+LEDGER_DIR = 'cache/ledger' # the walked commits of each repository, reused by its forks
+
+# Settings for the push event daemon (--serve)
+WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '') # the secret set on the GitHub webhook, if any
+DEBOUNCE = float(os.environ.get('DEBOUNCE', 10)) # seconds a burst of pushes has to be quiet before it is applied
+RENDER_INTERVAL = float(os.environ.get('RENDER_INTERVAL', 300)) # minimum seconds between SVG renders
+PUSH_COMMIT_LIMIT = 2048 # GitHub truncates the commits of a push event payload to this many
+PUSH_EVENTS = [] # (arrival time, payload) of the push events waiting to be applied
+PUSH_CONDITION = threading.Condition()
+PUSH_LOG = 'cache/push_log.txt' # hashes of the pushes already applied, as GitHub may deliver a push more than once
+PUSH_LOG_SIZE = 1000 # how many of the latest pushes are remembered
+
+# Settings for profiling each stage (--profile)
+PROFILE_DIR = None # where the per-stage pstats, allocation sites and summary are written
+PROFILE_TOP = 25 # how many allocation sites and functions to list
+PROFILE_STAGES = [] # (stage, wall time, cpu time, peak memory) of each profiled stage
+
+# Settings for memoizing GraphQL responses across runs (--no-memo to bypass)
+MEMO_FILE = 'cache/memo.json' # gitignored, the raw responses contain the names of private repositories
+MEMO_WINDOW = float(os.environ.get('MEMO_WINDOW', 3600)) # seconds that counts are reused for
+MEMO_TTL = {'user_getter': None, 'push_commit_stats': None, # never change, reused forever
+            'follower_getter': MEMO_WINDOW, 'graph_repos_stars': MEMO_WINDOW, 'graph_commits': MEMO_WINDOW, 'loc_query': MEMO_WINDOW}
+MEMO_ENTRIES = int(os.environ.get('MEMO_ENTRIES', 256)) # least recently used responses are evicted past this many
+MEMO_BYTES = int(os.environ.get('MEMO_BYTES', 4 * 1024 * 1024)) # or past this many bytes
+MEMO_BYPASS = False
+MEMO = None # query hash -> {'op', 'time', 'body'}, least recently used first, loaded by memo_load
+MEMO_HITS = 0
+MEMO_SIZE = 0 # total length of the memoized bodies
+MEMO_DIRTY = False # whether MEMO has changed since it was last saved by memo_save
 
 
 def daily_readme(birthday):
@@ -40,21 +107,131 @@ def format_plural(unit):
     return 's' if unit != 1 else ''
 
 
+class DeadlineError(Exception):
+    """
+    Raised when the run deadline leaves no time for another request
+    """
+
+
+def deadline_remaining():
+    """
+    Returns the seconds left before the run deadline, or None if there is no deadline (--serve)
+    Raises DeadlineError if there are none left
+    """
+    if DEADLINE == float('inf'):
+        return None
+    remaining = DEADLINE - DEADLINE_MARGIN - time.time()
+    if remaining <= 0:
+        raise DeadlineError('the run deadline has been reached')
+    return remaining
+
+
+def graph_post(func_name, query, variables):
+    """
+    Posts a query to GitHub's GraphQL v4 API, timing out after REQUEST_TIMEOUT seconds or at the run deadline
+    It is only counted as a call to func_name once it gets past the deadline check
+    """
+    remaining = deadline_remaining()
+    query_count(func_name)
+    try:
+        return requests.post('https://api.github.com/graphql', json={'query': query, 'variables':variables}, headers=HEADERS, timeout=REQUEST_TIMEOUT if remaining is None else min(REQUEST_TIMEOUT, remaining))
+    except requests.Timeout:
+        deadline_remaining() # raises DeadlineError if the request ran into the deadline
+        raise
+
+
 def simple_request(func_name, query, variables):
     """
-    Returns a request, or raises an Exception if the response does not succeed.
+    Returns the decoded data of a request, or raises an Exception if the response does not succeed.
+    Responses of the operations in MEMO_TTL are memoized, and replayed while they are younger than their TTL
     """
-    request = requests.post('https://api.github.com/graphql', json={'query': query, 'variables':variables}, headers=HEADERS)
+    key = hashlib.sha256((query + json.dumps(variables, sort_keys=True)).encode('utf-8')).hexdigest()
+    if func_name in MEMO_TTL:
+        body = memo_get(key, MEMO_TTL[func_name])
+        if body is not None:
+            return json_loads(body)['data']
+    request = graph_post(func_name, query, variables)
     if request.status_code == 200:
-        return request
+        if func_name in MEMO_TTL: memo_set(key, func_name, request.text)
+        return json_loads(request.content)['data'] # the only time this response is parsed
     raise Exception(func_name, ' has failed with a', request.status_code, request.text, QUERY_COUNT)
 
 
+class Repository:
+    """
+    The fields of a repository that cache_builder uses, projected from a loc_query edge
+    so the rest of the decoded response can be freed
+    """
+    __slots__ = ('name', 'commit_count', 'parent')
+
+    def __init__(self, node):
+        self.name = node['nameWithOwner']
+        self.commit_count = node['defaultBranchRef']['target']['history']['totalCount'] if node['defaultBranchRef'] else None # None if the repo is empty
+        self.parent = node['parent']['nameWithOwner'] if node['isFork'] and node['parent'] else None # None if it isn't a fork
+
+
+def memo_load():
+    """
+    Loads the memo cache file, or starts an empty memo cache if it doesn't exist yet
+    """
+    global MEMO, MEMO_SIZE
+    try:
+        with open(MEMO_FILE, 'r') as f:
+            MEMO = OrderedDict(json.load(f))
+    except (FileNotFoundError, ValueError): # a missing or corrupt memo cache is just a cold one
+        MEMO = OrderedDict()
+    MEMO_SIZE = sum(len(entry['body']) for entry in MEMO.values())
+
+
+def memo_get(key, ttl):
+    """
+    Returns the memoized response body for key if it is younger than ttl seconds (None means it never expires)
+    """
+    global MEMO_HITS, MEMO_SIZE, MEMO_DIRTY
+    if MEMO is None: memo_load()
+    entry = MEMO.get(key)
+    if MEMO_BYPASS or entry is None:
+        return None
+    if ttl is not None and time.time() - entry['time'] > ttl:
+        MEMO_SIZE -= len(MEMO.pop(key)['body'])
+        MEMO_DIRTY = True
+        return None
+    MEMO.move_to_end(key)
+    MEMO_HITS += 1
+    return entry['body']
+
+
+def memo_set(key, func_name, body):
+    """
+    Memoizes a response, evicting the least recently used ones past MEMO_ENTRIES or MEMO_BYTES
+    The memo cache file is only written by memo_save
+    """
+    global MEMO_SIZE, MEMO_DIRTY
+    if MEMO is None: memo_load()
+    if key in MEMO: MEMO_SIZE -= len(MEMO[key]['body'])
+    MEMO[key] = {'op': func_name, 'time': time.time(), 'body': body}
+    MEMO.move_to_end(key)
+    MEMO_SIZE += len(body)
+    while len(MEMO) > MEMO_ENTRIES or MEMO_SIZE > MEMO_BYTES:
+        MEMO_SIZE -= len(MEMO.popitem(last=False)[1]['body'])
+    MEMO_DIRTY = True
+
+
+def memo_save():
+    """
+    Saves the memo cache file if it has changed, once at the end of a run or of a batch of push events
+    """
+    global MEMO_DIRTY
+    if MEMO_DIRTY:
+        with open(MEMO_FILE, 'w') as f:
+            json.dump(MEMO, f)
+        MEMO_DIRTY = False
+
+
 def graph_commits(start_date, end_date):
     """
     Uses GitHub's GraphQL v4 API to return my total commit count
     """
-    query_count('graph_commits')
     query = '''
     query($start_date: DateTime!, $end_date: DateTime!, $login: String!) {
         user(login: $login) {
@@ -66,15 +243,14 @@ def graph_commits(start_date, end_date):
         }
     }'''
     variables = {'start_date': start_date,'end_date': end_date, 'login': USER_NAME}
-    request = simple_request(graph_commits.__name__, query, variables)
-    return int(request.json()['data']['user']['contributionsCollection']['contributionCalendar']['totalContributions'])
+    data = simple_request(graph_commits.__name__, query, variables)
+    return int(data['user']['contributionsCollection']['contributionCalendar']['totalContributions'])
 
 
 def graph_repos_stars(count_type, owner_affiliation, cursor=None, add_loc=0, del_loc=0):
     """
     Uses GitHub's GraphQL v4 API to return my total repository, star, or lines of code count.
     """
-    query_count('graph_repos_stars')
     query = '''
     query ($owner_affiliation: [RepositoryAffiliation], $login: String!, $cursor: String) {
         user(login: $login) {
@@ -98,19 +274,18 @@ def graph_repos_stars(count_type, owner_affiliation, cursor=None, add_loc=0, del
         }
     }'''
     variables = {'owner_affiliation': owner_affiliation, 'login': USER_NAME, 'cursor': cursor}
-    request = simple_request(graph_repos_stars.__name__, query, variables)
-    if request.status_code == 200:
-        if count_type == 'repos':
-            return request.json()['data']['user']['repositories']['totalCount']
-        elif count_type == 'stars':
-            return stars_counter(request.json()['data']['user']['repositories']['edges'])
+    repositories = simple_request(graph_repos_stars.__name__, query, variables)['user']['repositories']
+    if count_type == 'repos':
+        return repositories['totalCount']
+    elif count_type == 'stars':
+        return stars_counter(repositories['edges'])
 
 
-def recursive_loc(owner, repo_name, data, cache_comment, addition_total=0, deletion_total=0, my_commits=0, cursor=None):
+def recursive_loc(owner, repo_name, data, cache_comment, addition_total=0, deletion_total=0, my_commits=0, cursor=None, ledger=None, parent_ledger=None, unwalked=None):
     """
     Uses GitHub's GraphQL v4 API and cursor pagination to fetch 100 commits from a repository at a time
+    parent_ledger is the ledger of the repository this one is a fork of, if it has been walked
     """
-    query_count('recursive_loc')
     query = '''
     query ($repo_name: String!, $owner: String!, $cursor: String) {
         repository(name: $repo_name, owner: $owner) {
@@ -122,7 +297,13 @@ def recursive_loc(owner, repo_name, data, cache_comment, addition_total=0, delet
                             edges {
                                 node {
                                     ... on Commit {
+                                        oid
                                         committedDate
+                                        parents(first: 100) {
+                                            nodes {
+                                                oid
+                                            }
+                                        }
                                     }
                                     author {
                                         user {
@@ -144,10 +325,12 @@ def recursive_loc(owner, repo_name, data, cache_comment, addition_total=0, delet
         }
     }'''
     variables = {'repo_name': repo_name, 'owner': owner, 'cursor': cursor}
-    request = requests.post('https://api.github.com/graphql', json={'query': query, 'variables':variables}, headers=HEADERS) # I cannot use simple_request(), because I want to save the file before raising Exception
+    request = graph_post(recursive_loc.__name__, query, variables) # I cannot use simple_request(), because I want to save the file before raising Exception
     if request.status_code == 200:
-        if request.json()['data']['repository']['defaultBranchRef'] != None: # Only count commits if repo isn't empty
-            return loc_counter_one_repo(owner, repo_name, data, cache_comment, request.json()['data']['repository']['defaultBranchRef']['target']['history'], addition_total, deletion_total, my_commits)
+        history = history_page(json_loads(request.content)['data']['repository']['defaultBranchRef'])
+        del request # only the compact page is kept alive while the following pages are walked
+        if history != None: # Only count commits if repo isn't empty
+            return loc_counter_one_repo(owner, repo_name, data, cache_comment, history, addition_total, deletion_total, my_commits, ledger, parent_ledger, unwalked)
         else: return 0
     force_close_file(data, cache_comment) # saves what is currently in the file before this program crashes
     if request.status_code == 403:
@@ -155,20 +338,106 @@ def recursive_loc(owner, repo_name, data, cache_comment, addition_total=0, delet
     raise Exception('recursive_loc() has failed with a', request.status_code, request.text, QUERY_COUNT)
 
 
-def loc_counter_one_repo(owner, repo_name, data, cache_comment, history, addition_total, deletion_total, my_commits):
+def history_page(branch):
+    """
+    Projects a page of a defaultBranchRef's history onto the fields loc_counter_one_repo uses
+    Returns (total commit count, next page cursor or None, [(oid, mine, additions, deletions, parent oids)]), or None if the repo is empty
+    """
+    if branch is None:
+        return None
+    history = branch['target']['history']
+    return (history['totalCount'], history['pageInfo']['endCursor'] if history['pageInfo']['hasNextPage'] else None,
+            [(node['node']['oid'], node['node']['author']['user'] == OWNER_ID, node['node']['additions'], node['node']['deletions'],
+              tuple(parent['oid'] for parent in node['node']['parents']['nodes'])) for node in history['edges']])
+
+
+def loc_counter_one_repo(owner, repo_name, data, cache_comment, history, addition_total, deletion_total, my_commits, ledger, parent_ledger, unwalked=None):
     """
     Recursively call recursive_loc (since GraphQL can only search 100 commits at a time) 
     only adds the LOC value of commits authored by me
+    For a fork, stops walking once every commit left is an ancestor of one its parent has already walked,
+    and takes those from the parent's ledger
+    unwalked is the set of parents of walked commits that haven't been walked yet, only kept for forks
     """
-    for node in history['edges']:
-        if node['node']['author']['user'] == OWNER_ID:
+    if ledger is None: ledger = {}
+    if unwalked is None: unwalked = set()
+    total_count, cursor, commits = history
+    for oid, mine, additions, deletions, parents in commits:
+        if mine:
             my_commits += 1
-            addition_total += node['node']['additions']
-            deletion_total += node['node']['deletions']
+            addition_total += additions
+            deletion_total += deletions
+        ledger[oid] = ((1, additions, deletions) if mine else (0, 0, 0)) + (parents,)
+        if parent_ledger: # the commits that haven't been walked yet are all ancestors of the ones in unwalked
+            unwalked.discard(oid)
+            unwalked.update(parent for parent in parents if parent not in ledger)
+
+    if parent_ledger and unwalked and all(oid in parent_ledger for oid in unwalked):
+        for oid in ledger_ancestors(parent_ledger, unwalked):
+            if oid not in ledger:
+                ledger[oid] = parent_ledger[oid]
+                my_commits += ledger[oid][0]
+                addition_total += ledger[oid][1]
+                deletion_total += ledger[oid][2]
+    elif commits != [] and cursor is not None:
+        return recursive_loc(owner, repo_name, data, cache_comment, addition_total, deletion_total, my_commits, cursor, ledger, parent_ledger, unwalked)
+    ledger_write(owner + '/' + repo_name, ledger)
+    return addition_total, deletion_total, my_commits
+
+
+def ledger_ancestors(ledger, oids):
+    """
+    Returns oids and all of their ancestors in a ledger
+    """
+    ancestors, pending = set(), list(oids)
+    while pending:
+        oid = pending.pop()
+        if oid not in ancestors and oid in ledger:
+            ancestors.add(oid)
+            pending.extend(ledger[oid][3])
+    return ancestors
 
-    if history['edges'] == [] or not history['pageInfo']['hasNextPage']:
-        return addition_total, deletion_total, my_commits
-    else: return recursive_loc(owner, repo_name, data, cache_comment, addition_total, deletion_total, my_commits, history['pageInfo']['endCursor'])
+
+def ledger_read(name_with_owner):
+    """
+    Returns the ledger of a repository's walked commits as {oid: (mine, additions, deletions, parent oids)}, newest first,
+    or None if it hasn't been walked yet
+    """
+    if name_with_owner is None:
+        return None
+    try:
+        with open(os.path.join(LEDGER_DIR, hashlib.sha256(name_with_owner.encode('utf-8')).hexdigest() + '.txt'), 'r') as f:
+            data = f.readlines()
+    except FileNotFoundError:
+        return None
+    ledger = {}
+    for line in data:
+        if len(line.split()) != 5: # written before parent oids were kept, walk it again
+            return None
+        oid, mine, additions, deletions, parents = line.split()
+        ledger[oid] = (int(mine), int(additions), int(deletions), tuple(parents.split(',')) if parents != '-' else ())
+    return ledger
+
+
+def ledger_write(name_with_owner, ledger):
+    """
+    Saves the ledger of a repository's walked commits, so that its forks can reuse them
+    """
+    os.makedirs(LEDGER_DIR, exist_ok=True)
+    with open(os.path.join(LEDGER_DIR, hashlib.sha256(name_with_owner.encode('utf-8')).hexdigest() + '.txt'), 'w') as f:
+        for oid, (mine, additions, deletions, parents) in ledger.items():
+            f.write(oid + ' ' + str(mine) + ' ' + str(additions) + ' ' + str(deletions) + ' ' + (','.join(parents) or '-') + '\n')
+
+
+def fork_waves(stale, edges):
+    """
+    Splits the stale repositories in two, so that forks are only walked after their parent has written its ledger
+    """
+    walking = {edges[index].name for index in stale}
+    parents, forks = [], []
+    for index in stale:
+        (forks if edges[index].parent in walking else parents).append(index)
+    return parents, forks
 
 
 def loc_query(owner_affiliation, comment_size=0, force_cache=False, cursor=None, edges=[]):
@@ -178,7 +447,6 @@ def loc_query(owner_affiliation, comment_size=0, force_cache=False, cursor=None,
     requests and also give a 502 error.
     Returns the total number of lines of code in all repositories
     """
-    query_count('loc_query')
     query = '''
     query ($owner_affiliation: [RepositoryAffiliation], $login: String!, $cursor: String) {
         user(login: $login) {
@@ -187,6 +455,10 @@ def loc_query(owner_affiliation, comment_size=0, force_cache=False, cursor=None,
                 node {
                     ... on Repository {
                         nameWithOwner
+                        isFork
+                        parent {
+                            nameWithOwner
+                        }
                         defaultBranchRef {
                             target {
                                 ... on Commit {
@@ -207,12 +479,19 @@ def loc_query(owner_affiliation, comment_size=0, force_cache=False, cursor=None,
         }
     }'''
     variables = {'owner_affiliation': owner_affiliation, 'login': USER_NAME, 'cursor': cursor}
-    request = simple_request(loc_query.__name__, query, variables)
-    if request.json()['data']['user']['repositories']['pageInfo']['hasNextPage']:   # If repository data has another page
-        edges += request.json()['data']['user']['repositories']['edges']            # Add on to the LoC count
-        return loc_query(owner_affiliation, comment_size, force_cache, request.json()['data']['user']['repositories']['pageInfo']['endCursor'], edges)
+    repositories, cursor = repository_page(simple_request(loc_query.__name__, query, variables)['user']['repositories'])
+    if cursor is not None:   # If repository data has another page
+        return loc_query(owner_affiliation, comment_size, force_cache, cursor, edges + repositories)            # Add on to the LoC count
     else:
-        return cache_builder(edges + request.json()['data']['user']['repositories']['edges'], comment_size, force_cache)
+        return cache_builder(edges + repositories, comment_size, force_cache)
+
+
+def repository_page(repositories):
+    """
+    Projects a page of loc_query's repositories onto Repository records
+    Returns the records and the next page cursor, or None if it was the last page
+    """
+    return [Repository(edge['node']) for edge in repositories['edges']], repositories['pageInfo']['endCursor'] if repositories['pageInfo']['hasNextPage'] else None
 
 
 def cache_builder(edges, comment_size, force_cache, loc_add=0, loc_del=0):
@@ -240,17 +519,36 @@ def cache_builder(edges, comment_size, force_cache, loc_add=0, loc_del=0):
 
     cache_comment = data[:comment_size] # save the comment block
     data = data[comment_size:] # remove those lines
+    stale = [] # indexes of the repositories whose commit count has changed
     for index in range(len(edges)):
         repo_hash, commit_count, *__ = data[index].split()
-        if repo_hash == hashlib.sha256(edges[index]['node']['nameWithOwner'].encode('utf-8')).hexdigest():
-            try:
-                if int(commit_count) != edges[index]['node']['defaultBranchRef']['target']['history']['totalCount']:
-                    # if commit count has changed, update loc for that repo
-                    owner, repo_name = edges[index]['node']['nameWithOwner'].split('/')
-                    loc = recursive_loc(owner, repo_name, data, cache_comment)
-                    data[index] = repo_hash + ' ' + str(edges[index]['node']['defaultBranchRef']['target']['history']['totalCount']) + ' ' + str(loc[2]) + ' ' + str(loc[0]) + ' ' + str(loc[1]) + '\n'
-            except TypeError: # If the repo is empty
+        if repo_hash == hashlib.sha256(edges[index].name.encode('utf-8')).hexdigest():
+            if edges[index].commit_count is None: # If the repo is empty
                 data[index] = repo_hash + ' 0 0 0 0\n'
+            elif int(commit_count) != edges[index].commit_count:
+                stale.append(index)
+
+    recounted = 0
+    try:
+        for wave in fork_waves(stale, edges): # update loc for each repo whose commit count has changed
+            names = [edges[index].name for index in wave]
+            parents = [edges[index].parent for index in wave]
+            if LOC_ENGINE == 'git':
+                locs = git_loc_pool(names, parents, data, cache_comment)
+            else:
+                locs = (recursive_loc_or_stale(name, parent, data, cache_comment) for name, parent in zip(names, parents))
+            for index, loc in zip(wave, locs):
+                if loc is None: continue # its requests or git commands failed, it keeps its old row and is recounted next run
+                repo_hash = data[index].split()[0]
+                try:
+                    data[index] = repo_hash + ' ' + str(edges[index].commit_count) + ' ' + str(loc[2]) + ' ' + str(loc[0]) + ' ' + str(loc[1]) + '\n'
+                except TypeError: # If the repo is empty
+                    data[index] = repo_hash + ' 0 0 0 0\n'
+                recounted += 1
+    except DeadlineError: # keep the repos counted so far, the rest keep their old rows and are recounted next run
+        pass
+    if recounted < len(stale):
+        RUN_REPORT['LOC'] = 'stale ({} of {} changed repositories not recounted)'.format(len(stale) - recounted, len(stale))
     with open(filename, 'w') as f:
         f.writelines(cache_comment)
         f.writelines(data)
@@ -261,6 +559,318 @@ def cache_builder(edges, comment_size, force_cache, loc_add=0, loc_del=0):
     return [loc_add, loc_del, loc_add - loc_del, cached]
 
 
+def recursive_loc_or_stale(name_with_owner, parent, data, cache_comment):
+    """
+    Runs recursive_loc on a repository, or returns None if one of its requests times out or can't connect
+    """
+    try:
+        return recursive_loc(*name_with_owner.split('/'), data, cache_comment, parent_ledger=ledger_read(parent))
+    except (requests.Timeout, requests.ConnectionError) as error:
+        print('Failed to recount', name_with_owner + ':', error)
+        return None
+
+
+def git(*args, cwd=None, input=None):
+    """
+    Runs a git command and returns its output, or raises an Exception if it does not succeed.
+    The token is passed through the environment, so it never ends up in a mirror's config or the process list
+    """
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0', GIT_CONFIG_COUNT='1', GIT_CONFIG_KEY_0='http.extraHeader',
+               GIT_CONFIG_VALUE_0='AUTHORIZATION: basic ' + base64.b64encode(('x-access-token:' + os.environ['ACCESS_TOKEN']).encode('utf-8')).decode('utf-8'))
+    try:
+        result = subprocess.run(['git', *args], cwd=cwd, env=env, input=input, capture_output=True, text=True, timeout=deadline_remaining())
+    except subprocess.TimeoutExpired:
+        raise DeadlineError('git ' + args[0] + ' ran into the run deadline')
+    if result.returncode == 0:
+        return result.stdout
+    raise Exception('git ' + args[0], ' has failed with', result.returncode, result.stderr)
+
+
+def git_mirror(name_with_owner):
+    """
+    Clones a blob-less bare mirror of the repository, or incrementally fetches into it if it already exists.
+    Only commits and trees are downloaded up front, blobs are fetched lazily when git log --numstat needs them
+    Returns the path to the mirror
+    """
+    path = os.path.join(MIRROR_DIR, hashlib.sha256(name_with_owner.encode('utf-8')).hexdigest() + '.git')
+    url = GIT_REMOTE.format(name_with_owner)
+    if not os.path.isdir(path):
+        try:
+            git('clone', '--bare', '--quiet', '--filter=blob:none', url, path)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True) # don't leave a half cloned mirror behind
+            raise
+        return path
+    git('fetch', '--quiet', '--prune', 'origin', '+refs/heads/*:refs/heads/*', cwd=path)
+    for line in git('ls-remote', '--symref', 'origin', 'HEAD', cwd=path).splitlines(): # follow default branch renames
+        if line.startswith('ref: ') and line.split('\t')[-1] == 'HEAD': # a non-bare remote also lists refs/remotes/origin/HEAD
+            git('symbolic-ref', 'HEAD', line[5:].split('\t')[0], cwd=path)
+    return path
+
+
+def git_loc(name_with_owner, revision='HEAD', parent=None):
+    """
+    Uses a local mirror of the repository and git log --numstat to count the LOC of the default branch,
+    or of a revision range such as 'before..after'
+    only adds the LOC value of commits authored by me (see GIT_AUTHORS)
+    Merge commits are diffed against their first parent, like GitHub's additions and deletions
+    For a fork, only the commits that aren't in the parent's ledger are diffed, the rest are reused from it
+    Returns the same (additions, deletions, my_commits) as recursive_loc, or 0 if the repo is empty
+    """
+    path = git_mirror(name_with_owner)
+    if subprocess.run(['git', 'rev-parse', '--verify', '--quiet', 'HEAD'], cwd=path, capture_output=True).returncode != 0:
+        return 0
+    parent_ledger = ledger_read(parent) or {}
+    parents = {line.split()[0]: tuple(line.split()[1:]) for line in git('rev-list', '--parents', revision, cwd=path).splitlines()}
+    ledger = dict.fromkeys(parents)
+    unique = [oid for oid in ledger if oid not in parent_ledger]
+    if unique: # with no commits on stdin, git log would fall back to HEAD
+        log = git('log', '--no-walk=unsorted', '--stdin', '--numstat', '--diff-merges=first-parent', '--format=%H', '--fixed-strings',
+                  *['--author=' + author for author in GIT_AUTHORS], cwd=path, input='\n'.join(unique) + '\n')
+        for line in log.splitlines():
+            if '\t' in line:
+                additions, deletions, _ = line.split('\t', 2)
+                if additions != '-': # binary files have no line count
+                    ledger[oid] = (1, ledger[oid][1] + int(additions), ledger[oid][2] + int(deletions), parents[oid])
+            elif line:
+                oid = line
+                ledger[oid] = (1, 0, 0, parents[oid])
+    for oid in ledger:
+        if ledger[oid] is None: ledger[oid] = parent_ledger.get(oid, (0, 0, 0))[:3] + (parents[oid],)
+    if revision == 'HEAD': ledger_write(name_with_owner, ledger)
+    return sum(entry[1] for entry in ledger.values()), sum(entry[2] for entry in ledger.values()), sum(entry[0] for entry in ledger.values())
+
+
+def git_loc_or_stale(name_with_owner, parent):
+    """
+    Runs git_loc on a repository's default branch, or returns None if a git command fails
+    (e.g. the remote can't be reached, or access to it was lost), so only the run deadline stops the walk
+    """
+    try:
+        return git_loc(name_with_owner, 'HEAD', parent)
+    except DeadlineError:
+        raise
+    except Exception as error:
+        print('Failed to recount', name_with_owner + ':', error)
+        return None
+
+
+def git_loc_pool(names, parents, data, cache_comment):
+    """
+    Runs git_loc on every repository in names (forks of the matching repository in parents) across a process pool,
+    yielding the results in order
+    """
+    os.makedirs(MIRROR_DIR, exist_ok=True)
+    executor = ProcessPoolExecutor(max_workers=GIT_WORKERS)
+    try:
+        yield from executor.map(git_loc_or_stale, names, parents, timeout=deadline_remaining())
+    except concurrent.futures.TimeoutError:
+        raise DeadlineError('git_loc ran into the run deadline')
+    except DeadlineError:
+        raise
+    except Exception:
+        force_close_file(data, cache_comment) # saves what is currently in the file before this program crashes
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True) # the running git commands time out by themselves
+
+
+def push_commit_stats(owner, repo_name, oids):
+    """
+    Uses GitHub's GraphQL v4 API to fetch the pushed commits, 100 commits at a time
+    Returns the (additions, deletions, my_commits) of the ones authored by me
+    """
+    addition_total, deletion_total, my_commits = 0, 0, 0
+    for start in range(0, len(oids), 100):
+        chunk = oids[start:start + 100]
+        commits = ''.join('''
+            commit{0}: object(oid: $oid{0}) {{
+                ... on Commit {{
+                    author {{
+                        user {{
+                            id
+                        }}
+                    }}
+                    deletions
+                    additions
+                }}
+            }}'''.format(index) for index in range(len(chunk)))
+        query = '''
+    query ($repo_name: String!, $owner: String!''' + ''.join(', $oid{}: GitObjectID!'.format(index) for index in range(len(chunk))) + ''') {
+        repository(name: $repo_name, owner: $owner) {''' + commits + '''
+        }
+    }'''
+        variables = {'repo_name': repo_name, 'owner': owner}
+        variables.update({'oid' + str(index): oid for index, oid in enumerate(chunk)})
+        for commit in simple_request(push_commit_stats.__name__, query, variables)['repository'].values():
+            if commit is not None and commit['author']['user'] == OWNER_ID:
+                my_commits += 1
+                addition_total += commit['additions']
+                deletion_total += commit['deletions']
+    return addition_total, deletion_total, my_commits
+
+
+def push_update(payload, comment_size):
+    """
+    Updates the cache row of the repository a push event was sent for, using the stats of the pushed commits
+    Returns True if the row was updated, False if the push doesn't touch the default branch, or None if it can only
+    be counted by rediscovering every repository (an unknown repository, a force push or a truncated commit list)
+    """
+    name_with_owner = payload['repository']['full_name']
+    if payload['deleted'] or payload['ref'] != 'refs/heads/' + payload['repository']['default_branch']:
+        return False
+    if payload['forced'] or payload['created'] or len(payload['commits']) >= PUSH_COMMIT_LIMIT:
+        return None
+    push_hash = hashlib.sha256((name_with_owner + ' ' + payload['before'] + ' ' + payload['after']).encode('utf-8')).hexdigest()
+    try:
+        with open(PUSH_LOG, 'r') as f:
+            push_log = f.read().split()
+    except FileNotFoundError:
+        push_log = []
+    if push_hash in push_log: # a redelivery of a push that has already been counted
+        return False
+    filename = 'cache/'+hashlib.sha256(USER_NAME.encode('utf-8')).hexdigest()+'.txt' # Use the same filename as cache_builder
+    with open(filename, 'r') as f:
+        data = f.readlines()
+    repo_hash = hashlib.sha256(name_with_owner.encode('utf-8')).hexdigest()
+    for index in range(comment_size, len(data)):
+        if data[index].split()[0] == repo_hash:
+            break
+    else: return None
+
+    if LOC_ENGINE == 'git':
+        loc = git_loc(name_with_owner, payload['before'] + '..' + payload['after'])
+    else:
+        loc = push_commit_stats(*name_with_owner.split('/'), [commit['id'] for commit in payload['commits']])
+    if loc == 0: loc = (0, 0, 0)
+    commit_count, my_commits, loc_add, loc_del = [int(column) for column in data[index].split()[1:5]]
+    data[index] = repo_hash + ' ' + str(commit_count + len(payload['commits'])) + ' ' + str(my_commits + loc[2]) + ' ' + str(loc_add + loc[0]) + ' ' + str(loc_del + loc[1]) + '\n'
+    with open(filename, 'w') as f:
+        f.writelines(data)
+    with open(PUSH_LOG, 'w') as f:
+        f.writelines(line + '\n' for line in (push_log + [push_hash])[-PUSH_LOG_SIZE:])
+    return True
+
+
+def push_apply(payloads, comment_size):
+    """
+    Applies a batch of push events to the cache file, rediscovering every repository at most once
+    Returns True if the cache has changed
+    """
+    global MEMO_BYPASS
+    updated, discover = False, False
+    for payload in payloads:
+        result = push_update(payload, comment_size)
+        updated |= bool(result)
+        discover |= result is None
+    if discover: # commit counts have just changed, so they can't come from the memo cache
+        memo_bypass, MEMO_BYPASS = MEMO_BYPASS, True
+        try:
+            loc_query(['OWNER', 'COLLABORATOR', 'ORGANIZATION_MEMBER'], comment_size, False, None, [])
+        finally:
+            MEMO_BYPASS = memo_bypass
+    return updated or discover
+
+
+def push_render(comment_size):
+    """
+    Re-renders the SVGs from the cache file, without rediscovering every repository
+    """
+    total_loc = cache_totals(comment_size)
+    commit_data = commit_counter(comment_size)
+    star_data = graph_repos_stars('stars', ['OWNER'])
+    repo_data = graph_repos_stars('repos', ['OWNER'])
+    contrib_data = graph_repos_stars('repos', ['OWNER', 'COLLABORATOR', 'ORGANIZATION_MEMBER'])
+    follower_data = follower_getter(USER_NAME)
+    commit_data, contrib_data = archive_totals(total_loc, commit_data, contrib_data)
+    svg_render(daily_readme(BIRTHDAY), number_format(commit_data, 7), star_data, number_format(repo_data, 2),
+               number_format(contrib_data, 2), number_format(follower_data, 4), total_loc)
+
+
+def push_worker(comment_size):
+    """
+    Applies the queued push events once a burst has been quiet for DEBOUNCE seconds,
+    and re-renders the SVGs at most once every RENDER_INTERVAL seconds
+    """
+    last_render, dirty = time.monotonic() - RENDER_INTERVAL, False
+    while True:
+        with PUSH_CONDITION:
+            while True:
+                now = time.monotonic()
+                if PUSH_EVENTS and now - PUSH_EVENTS[-1][0] >= DEBOUNCE: break
+                if not PUSH_EVENTS and dirty and now - last_render >= RENDER_INTERVAL: break
+                if PUSH_EVENTS: PUSH_CONDITION.wait(DEBOUNCE - (now - PUSH_EVENTS[-1][0]))
+                elif dirty: PUSH_CONDITION.wait(RENDER_INTERVAL - (now - last_render))
+                else: PUSH_CONDITION.wait()
+            payloads = [payload for _, payload in PUSH_EVENTS]
+            PUSH_EVENTS.clear()
+        try:
+            dirty |= push_apply(payloads, comment_size)
+        except Exception as error: # keep listening, the next push or scheduled run will catch up
+            print('Failed to apply', len(payloads), 'push event(s):', error)
+        if dirty and time.monotonic() - last_render >= RENDER_INTERVAL:
+            last_render = time.monotonic() # a failed render is retried after RENDER_INTERVAL, not straight away
+            try:
+                push_render(comment_size)
+                dirty = False
+                print('Rendered the SVGs after', len(payloads), 'push event(s)')
+            except Exception as error:
+                print('Failed to render the SVGs:', error)
+        memo_save()
+
+
+class PushHandler(BaseHTTPRequestHandler):
+    """
+    Receives GitHub webhook deliveries, and queues the push events for push_worker
+    Both of the webhook content types are accepted: application/json, and application/x-www-form-urlencoded (payload=...)
+    """
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if WEBHOOK_SECRET:
+            signature = 'sha256=' + hmac.new(WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(signature, self.headers.get('X-Hub-Signature-256', '')):
+                self.send_response(401)
+                self.end_headers()
+                return
+        if self.headers.get('X-GitHub-Event') == 'push':
+            try:
+                if self.headers.get('Content-Type', '').split(';')[0].strip() == 'application/x-www-form-urlencoded':
+                    body = urllib.parse.parse_qs(body.decode('utf-8'))['payload'][0]
+                payload = json.loads(body)
+            except (ValueError, KeyError): # also covers UnicodeDecodeError and json.JSONDecodeError
+                self.send_response(400)
+                self.end_headers()
+                return
+            with PUSH_CONDITION:
+                PUSH_EVENTS.append((time.monotonic(), payload))
+                PUSH_CONDITION.notify()
+        self.send_response(202)
+        self.end_headers()
+
+
+def push_serve(port, comment_size):
+    """
+    Listens for GitHub push events on a local HTTP endpoint, keeping the cache file and SVGs up to date
+    """
+    threading.Thread(target=push_worker, args=(comment_size,), daemon=True).start()
+    print('Listening for push events on', WEBHOOK_HOST + ':' + str(port))
+    ThreadingHTTPServer((WEBHOOK_HOST, port), PushHandler).serve_forever()
+
+
+def push_replay(filenames, comment_size):
+    """
+    Applies recorded push event payloads (one payload, or a list of them, per JSON file), then re-renders the SVGs once
+    """
+    payloads = []
+    for filename in filenames:
+        with open(filename, 'r') as f:
+            payload = json.load(f)
+        payloads += payload if isinstance(payload, list) else [payload]
+    if push_apply(payloads, comment_size):
+        push_render(comment_size)
+    memo_save()
+
+
 def flush_cache(edges, filename, comment_size):
     """
     Wipes the cache file
@@ -273,7 +883,22 @@ def flush_cache(edges, filename, comment_size):
     with open(filename, 'w') as f:
         f.writelines(data)
         for node in edges:
-            f.write(hashlib.sha256(node['node']['nameWithOwner'].encode('utf-8')).hexdigest() + ' 0 0 0 0\n')
+            f.write(hashlib.sha256(node.name.encode('utf-8')).hexdigest() + ' 0 0 0 0\n')
+
+
+def cache_totals(comment_size):
+    """
+    Returns the LOC totals of the cache file, in the same form as cache_builder
+    """
+    loc_add, loc_del = 0, 0
+    filename = 'cache/'+hashlib.sha256(USER_NAME.encode('utf-8')).hexdigest()+'.txt' # Use the same filename as cache_builder
+    with open(filename, 'r') as f:
+        data = f.readlines()[comment_size:]
+    for line in data:
+        loc = line.split()
+        loc_add += int(loc[3])
+        loc_del += int(loc[4])
+    return [loc_add, loc_del, loc_add - loc_del, True]
 
 
 def add_archive():
@@ -295,6 +920,20 @@ def add_archive():
     added_commits += int(old_data[-1].split()[4][:-1])
     return [added_loc, deleted_loc, added_loc - deleted_loc, added_commits, contributed_repos]
 
+def archive_totals(total_loc, commit_data, contrib_data):
+    """
+    Adds the last known data of my deleted repositories to the totals
+    Returns the updated commit and contributed repository counts
+    """
+    if OWNER_ID == {'id': 'U_kgDOCKiADQ'}: # only calculate for user
+        archived_data = add_archive()
+        for index in range(len(total_loc)-1):
+            total_loc[index] += archived_data[index]
+        if contrib_data is not None: contrib_data += archived_data[-1] # a stale count already includes them
+        commit_data += int(archived_data[-2])
+    return commit_data, contrib_data
+
+
 def force_close_file(data, cache_comment):
     """
     Forces the file to close, preserving whatever data was written to it
@@ -336,6 +975,48 @@ def svg_overwrite(filename, age_data, commit_data, star_data, repo_data, contrib
     f.close()
 
 
+def svg_fallback(filename, *counts):
+    """
+    Returns counts, with the ones that couldn't be fetched (None) replaced by the values currently in the SVG file
+    The values are read from the same elements that svg_overwrite writes the star, repository, contributed repository
+    and follower counts to
+    """
+    tspan = minidom.parse(filename).getElementsByTagName('tspan')
+    counts = list(counts)
+    for position, index in enumerate([71, 65, 67, 73]):
+        if counts[position] is None:
+            try:
+                counts[position] = int(tspan[index].firstChild.data.replace(',', '').strip())
+            except ValueError:
+                counts[position] = 0
+    return counts
+
+
+def deadline_stage(stage, funct, *args):
+    """
+    Runs a stage with perf_counter, and records in RUN_REPORT whether its result is fresh
+    Returns None as the result if the run deadline was reached, or a request timed out or couldn't connect,
+    so the previous value can be used instead
+    """
+    try:
+        funct_return, difference = perf_counter(funct, *args)
+    except (DeadlineError, requests.Timeout, requests.ConnectionError) as error:
+        RUN_REPORT[stage] = 'stale (' + str(error) + ')'
+        return None, 0
+    RUN_REPORT.setdefault(stage, 'fresh')
+    return funct_return, difference
+
+
+def svg_render(age_data, commit_data, star_data, repo_data, contrib_data, follower_data, total_loc):
+    """
+    Formats the LOC totals and writes all the data to both SVG files
+    """
+    for index in range(len(total_loc)-1): total_loc[index] = '{:,}'.format(total_loc[index]) # format added, deleted, and total LOC
+
+    svg_overwrite('dark_mode.svg', age_data, commit_data, star_data, repo_data, contrib_data, follower_data, total_loc[:-1])
+    svg_overwrite('white_mode.svg', age_data, commit_data, star_data, repo_data, contrib_data, follower_data, total_loc[:-1])
+
+
 def commit_counter(comment_size):
     """
     Counts up my total commits, using the cache file created by cache_builder.
@@ -365,7 +1046,6 @@ def user_getter(username):
     """
     Returns the account ID and creation time of the user
     """
-    query_count('user_getter')
     query = '''
     query($login: String!){
         user(login: $login) {
@@ -374,14 +1054,13 @@ def user_getter(username):
         }
     }'''
     variables = {'login': username}
-    request = simple_request(user_getter.__name__, query, variables)
-    return {'id': request.json()['data']['user']['id']}, request.json()['data']['user']['createdAt']
+    data = simple_request(user_getter.__name__, query, variables)
+    return {'id': data['user']['id']}, data['user']['createdAt']
 
 def follower_getter(username):
     """
     Returns the number of followers of the user
     """
-    query_count('follower_getter')
     query = '''
     query($login: String!){
         user(login: $login) {
@@ -390,8 +1069,8 @@ def follower_getter(username):
             }
         }
     }'''
-    request = simple_request(follower_getter.__name__, query, {'login': username})
-    return int(request.json()['data']['user']['followers']['totalCount'])
+    data = simple_request(follower_getter.__name__, query, {'login': username})
+    return int(data['user']['followers']['totalCount'])
 
 
 def query_count(funct_id):
@@ -407,11 +1086,56 @@ def perf_counter(funct, *args):
     Calculates the time it takes for a function to run
     Returns the function result and the time differential
     """
+    if PROFILE_DIR:
+        return profile_counter(funct, *args)
     start = time.perf_counter()
     funct_return = funct(*args)
     return funct_return, time.perf_counter() - start
 
 
+def profile_counter(funct, *args):
+    """
+    Runs a function under cProfile and tracemalloc, saving its pstats and top allocation sites to PROFILE_DIR
+    CPU time includes child processes, such as the git engine's process pool
+    Returns the function result and the time differential, like perf_counter
+    """
+    stage = funct.__name__
+    repeats = sum(1 for row in PROFILE_STAGES if row[0].split('.')[0] == stage)
+    if repeats: stage += '.' + str(repeats + 1) # e.g. graph_repos_stars.2
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    cpu_start, start = sum(os.times()[:4]), time.perf_counter()
+    profiler.enable()
+    try:
+        funct_return = funct(*args)
+    finally:
+        profiler.disable()
+        difference, cpu = time.perf_counter() - start, sum(os.times()[:4]) - cpu_start
+        snapshot, peak = tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        profiler.dump_stats(os.path.join(PROFILE_DIR, stage + '.pstats'))
+        with open(os.path.join(PROFILE_DIR, stage + '.alloc.txt'), 'w') as f:
+            for stat in snapshot.statistics('lineno')[:PROFILE_TOP]: f.write(str(stat) + '\n')
+        PROFILE_STAGES.append((stage, difference, cpu, peak))
+    return funct_return, difference
+
+
+def profile_summary():
+    """
+    Writes the wall time, CPU time and peak memory of every profiled stage to PROFILE_DIR/summary.txt,
+    followed by the most expensive functions of all stages merged together
+    """
+    with open(os.path.join(PROFILE_DIR, 'summary.txt'), 'w') as f:
+        f.write('{:<24}{:>12}{:>12}{:>16}\n'.format('stage', 'wall (s)', 'cpu (s)', 'peak memory'))
+        for stage, difference, cpu, peak in PROFILE_STAGES:
+            f.write('{:<24}{:>12.4f}{:>12.4f}{:>13,} KB\n'.format(stage, difference, cpu, peak // 1024))
+        f.write('{:<24}{:>12.4f}{:>12.4f}\n\n'.format('total', sum(row[1] for row in PROFILE_STAGES), sum(row[2] for row in PROFILE_STAGES)))
+        stats = pstats.Stats(*[os.path.join(PROFILE_DIR, row[0] + '.pstats') for row in PROFILE_STAGES], stream=f)
+        stats.dump_stats(os.path.join(PROFILE_DIR, 'all.pstats'))
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+    print('Profiles of each stage have been saved to', PROFILE_DIR)
+
+
 def formatter(query_type, difference, funct_return=False, whitespace=0):
     """
     Prints a formatted time differential
@@ -420,37 +1144,76 @@ def formatter(query_type, difference, funct_return=False, whitespace=0):
     print('{:<23}'.format('   ' + query_type + ':'), sep='', end='')
     print('{:>12}'.format('%.4f' % difference + ' s ')) if difference > 1 else print('{:>12}'.format('%.4f' % (difference * 1000) + ' ms'))
     if whitespace:
-        return f"{'{:,}'.format(funct_return): <{whitespace}}"
+        return number_format(funct_return, whitespace)
     return funct_return
 
 
+def number_format(number, whitespace):
+    """
+    Returns a number with comma separators, left aligned to whitespace characters
+    """
+    return f"{'{:,}'.format(number): <{whitespace}}"
+
+
 if __name__ == '__main__':
     """
     Andrew Grant (Andrew6rant), 2022-2024
     """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loc-engine', choices=['graphql', 'git'], default=LOC_ENGINE,
+                        help='count LOC with the GraphQL API, or with local blob-less git mirrors of each repository')
+    parser.add_argument('--serve', type=int, nargs='?', const=8080, metavar='PORT',
+                        help='keep running, and update the cache and SVGs from GitHub push events sent to PORT (JSON or form-encoded webhooks)')
+    parser.add_argument('--replay', nargs='+', metavar='PAYLOAD',
+                        help='apply recorded push event payloads, then re-render the SVGs')
+    parser.add_argument('--profile', nargs='?', const='profile', metavar='DIR',
+                        help='run each stage of a full run under cProfile and tracemalloc, and save the results to DIR (not with --replay or --serve)')
+    parser.add_argument('--no-memo', action='store_true',
+                        help='ignore memoized GraphQL responses, and refresh them from the API')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='stop fetching after SECONDS and render the SVGs from the best available numbers (default: RUN_BUDGET)')
+    args = parser.parse_args()
+    if args.profile and (args.replay or args.serve is not None): # only the stages of a full run are profiled
+        parser.error('--profile cannot be combined with --replay or --serve')
+    if args.deadline is not None:
+        DEADLINE = time.time() + args.deadline
+    if args.serve is not None: # the daemon runs indefinitely, its requests only time out after REQUEST_TIMEOUT
+        DEADLINE = float('inf')
+    os.environ['RUN_DEADLINE'] = str(DEADLINE)
+    LOC_ENGINE = args.loc_engine
+    MEMO_BYPASS = args.no_memo
+    if args.profile:
+        PROFILE_DIR = args.profile
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+
     print('Calculation times:')
     # define global variable for owner ID and calculate user's creation date
     # e.g {'id': 'MDQ6VXNlcjU3MzMxMTM0'} and 2019-11-03T21:15:07Z for username 'Andrew6rant'
     user_data, user_time = perf_counter(user_getter, USER_NAME)
     OWNER_ID, acc_date = user_data
     formatter('account data', user_time)
-    age_data, age_time = perf_counter(daily_readme, datetime.datetime(2002, 7, 5))
+    if args.replay:
+        push_replay(args.replay, 7)
+    if args.serve is not None:
+        push_serve(args.serve, 7)
+    if args.replay or args.serve is not None:
+        raise SystemExit
+    age_data, age_time = perf_counter(daily_readme, BIRTHDAY)
     formatter('age calculation', age_time)
-    total_loc, loc_time = perf_counter(loc_query, ['OWNER', 'COLLABORATOR', 'ORGANIZATION_MEMBER'], 7)
+    # if the run deadline is reached, each stage falls back to its last known value: the cache file, or the SVG
+    total_loc, loc_time = deadline_stage('LOC', loc_query, ['OWNER', 'COLLABORATOR', 'ORGANIZATION_MEMBER'], 7, False, None, [])
+    if total_loc is None: total_loc = cache_totals(7)
     formatter('LOC (cached)', loc_time) if total_loc[-1] else formatter('LOC (no cache)', loc_time)
     commit_data, commit_time = perf_counter(commit_counter, 7)
-    star_data, star_time = perf_counter(graph_repos_stars, 'stars', ['OWNER'])
-    repo_data, repo_time = perf_counter(graph_repos_stars, 'repos', ['OWNER'])
-    contrib_data, contrib_time = perf_counter(graph_repos_stars, 'repos', ['OWNER', 'COLLABORATOR', 'ORGANIZATION_MEMBER'])
-    follower_data, follower_time = perf_counter(follower_getter, USER_NAME)
+    RUN_REPORT['commit counter'] = RUN_REPORT['LOC'] # counted from the same cache rows
+    star_data, star_time = deadline_stage('star counter', graph_repos_stars, 'stars', ['OWNER'])
+    repo_data, repo_time = deadline_stage('my repositories', graph_repos_stars, 'repos', ['OWNER'])
+    contrib_data, contrib_time = deadline_stage('contributed repos', graph_repos_stars, 'repos', ['OWNER', 'COLLABORATOR', 'ORGANIZATION_MEMBER'])
+    follower_data, follower_time = deadline_stage('follower counter', follower_getter, USER_NAME)
 
     # several repositories that I've contributed to have since been deleted.
-    if OWNER_ID == {'id': 'U_kgDOCKiADQ'}: # only calculate for user 
-        archived_data = add_archive()
-        for index in range(len(total_loc)-1):
-            total_loc[index] += archived_data[index]
-        contrib_data += archived_data[-1]
-        commit_data += int(archived_data[-2])
+    commit_data, contrib_data = archive_totals(total_loc, commit_data, contrib_data)
+    star_data, repo_data, contrib_data, follower_data = svg_fallback('dark_mode.svg', star_data, repo_data, contrib_data, follower_data)
 
     commit_data = formatter('commit counter', commit_time, commit_data, 7)
     star_data = formatter('star counter', star_time, star_data)
@@ -458,15 +1221,18 @@ if __name__ == '__main__':
     contrib_data = formatter('contributed repos', contrib_time, contrib_data, 2)
     follower_data = formatter('follower counter', follower_time, follower_data, 4)
 
-    for index in range(len(total_loc)-1): total_loc[index] = '{:,}'.format(total_loc[index]) # format added, deleted, and total LOC
-
-    svg_overwrite('dark_mode.svg', age_data, commit_data, star_data, repo_data, contrib_data, follower_data, total_loc[:-1])
-    svg_overwrite('light_mode.svg', age_data, commit_data, star_data, repo_data, contrib_data, follower_data, total_loc[:-1])
+    __, svg_time = perf_counter(svg_render, age_data, commit_data, star_data, repo_data, contrib_data, follower_data, total_loc)
+    formatter('svg render', svg_time)
+    memo_save()
 
     # move cursor to override 'Calculation times:' with 'Total function time:' and the total function time, then move cursor back
-    print('\033[F\033[F\033[F\033[F\033[F\033[F\033[F\033[F',
-        '{:<21}'.format('Total function time:'), '{:>11}'.format('%.4f' % (user_time + age_time + loc_time + commit_time + star_time + repo_time + contrib_time)),
-        ' s \033[E\033[E\033[E\033[E\033[E\033[E\033[E\033[E', sep='')
+    print('\033[F\033[F\033[F\033[F\033[F\033[F\033[F\033[F\033[F\033[F',
+        '{:<21}'.format('Total function time:'), '{:>11}'.format('%.4f' % (user_time + age_time + loc_time + commit_time + star_time + repo_time + contrib_time + follower_time + svg_time)),
+        ' s \033[E\033[E\033[E\033[E\033[E\033[E\033[E\033[E\033[E\033[E', sep='')
 
     print('Total GitHub GraphQL API calls:', '{:>3}'.format(sum(QUERY_COUNT.values())))
     for funct_name, count in QUERY_COUNT.items(): print('{:<28}'.format('   ' + funct_name + ':'), '{:>6}'.format(count))
+    print('Memoized responses reused:', '{:>8}'.format(MEMO_HITS))
+    print('Run report:')
+    for stage, state in RUN_REPORT.items(): print('{:<28}'.format('   ' + stage + ':'), state)
+    if PROFILE_DIR: profile_summary()